@@ -3,20 +3,32 @@
 from __future__ import annotations
 
 import atexit
+import functools
 import json
 import logging
 import threading
 import time
-from collections import deque
-from itertools import islice
-from datetime import datetime, timezone
 from typing import Any, Dict, Optional
 from uuid import uuid4
 
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, Response, render_template, request
 
 import paho.mqtt.client as mqtt
 
+try:
+	import orjson
+except ImportError:  # environments without the optional accelerator
+	orjson = None
+
+if orjson is not None:
+	_json_loads = orjson.loads
+	_json_dumps = orjson.dumps
+else:
+	_json_loads = json.loads
+
+	def _json_dumps(obj: Any) -> bytes:
+		return json.dumps(obj).encode("utf-8")
+
 
 MQTT_BROKER = "mqtt.iotserver.uz"
 MQTT_PORT = 1883
@@ -31,6 +43,7 @@ TOPIC_LEDS = {
 	"yellow": "ttpu/iot/maqsud/led/yellow",
 }
 TOPIC_DISPLAY = "ttpu/iot/maqsud/display"
+_LED_TOPIC_TO_COLOR = {topic: color for color, topic in TOPIC_LEDS.items()}
 LIGHT_MAX = 4096
 MAX_EVENT_HISTORY = 25
 VALID_LED_STATES = {"ON", "OFF"}
@@ -46,17 +59,69 @@ logger = logging.getLogger("dashboard")
 app = Flask(__name__, static_folder="static", template_folder="templates")
 
 
-state_lock = threading.Lock()
-latest_sensor: Dict[str, Optional[float]] = {"light": None, "timestamp": None}
-button_events: deque[Dict[str, Any]] = deque(maxlen=MAX_EVENT_HISTORY)
+leds_lock = threading.Lock()
+conn_lock = threading.Lock()
+
+# Latest light reading, written lock-free by the MQTT thread. Each store is
+# an atomic reference assignment under the GIL; readers re-check for a torn
+# value/timestamp pair instead of taking a lock.
+_latest_light: Optional[float] = None
+_latest_light_ts: Optional[float] = None
+
+# Single-producer (MQTT thread) ring buffer for button events. Slot stores
+# and the index increment are atomic under the GIL, so readers snapshot the
+# index and copy slots without taking a lock.
+_events_buf: list = [None] * MAX_EVENT_HISTORY
+_events_idx = 0
 connection_state: Dict[str, Any] = {
 	"connected": False,
 	"last_error": None,
 	"last_message_at": None,
 }
 
+# led_states is the write-side source of truth, guarded by leds_lock; every
+# write republishes an immutable tuple snapshot that readers grab lock-free.
 led_states: Dict[str, str] = {color: "OFF" for color in TOPIC_LEDS}
-last_display_message: Dict[str, Any] = {"text": "", "timestamp": None}
+_led_snapshot: tuple = tuple(led_states.items())
+
+# (text, timestamp) pair published as one atomic reference assignment.
+_display_snapshot: tuple = ("", None)
+
+_state_dirty = True
+_state_cache: bytes = b""
+
+# The meta block never changes, so encode it once and splice the fragment
+# into each rebuilt /api/state body instead of re-serializing it.
+_META_JSON = _json_dumps({
+	"topics": {
+		"light": TOPIC_LIGHT,
+		"button": TOPIC_BUTTON,
+		"leds": TOPIC_LEDS,
+		"display": TOPIC_DISPLAY,
+	},
+	"light_max": LIGHT_MAX,
+})
+
+
+# Wakes /api/stream clients whenever state changes. A Condition with a
+# sequence number (rather than a shared Event) lets every connected client
+# observe every update without racing to clear a flag.
+_update_cond = threading.Condition()
+_update_seq = 0
+
+
+def _mark_state_dirty() -> None:
+	global _state_dirty, _update_seq
+	_state_dirty = True
+	with _update_cond:
+		_update_seq += 1
+		_update_cond.notify_all()
+
+
+def _json(obj: Any, status: int = 200) -> Response:
+	"""Serialize obj with the fast encoder, bypassing Flask's jsonify."""
+
+	return Response(_json_dumps(obj), status=status, mimetype="application/json")
 
 
 mqtt_start_lock = threading.Lock()
@@ -67,6 +132,12 @@ mqtt_client: Optional[mqtt.Client] = None
 def _safe_timestamp(raw: Any) -> Optional[float]:
 	"""Convert raw timestamp values to float seconds since epoch when possible."""
 
+	# Exact type checks fast-path the native numbers that almost every
+	# payload carries, skipping try/except setup and the isinstance MRO walk.
+	if type(raw) is float:
+		return raw
+	if type(raw) is int:
+		return float(raw)
 	if raw is None:
 		return None
 	try:
@@ -75,29 +146,21 @@ def _safe_timestamp(raw: Any) -> Optional[float]:
 		return None
 
 
-def _to_iso(timestamp: Optional[float]) -> Optional[str]:
-	if not timestamp:
-		return None
-	try:
-		return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
-	except (OSError, OverflowError, ValueError, TypeError):
-		return None
-
-
-def _handle_light_payload(payload: Dict[str, Any]) -> None:
+def _handle_light_payload(payload: Dict[str, Any], now: float) -> None:
 	light_value = payload.get("light")
 	if not isinstance(light_value, (int, float)):
 		logger.warning("Unexpected light payload: %s", payload)
 		return
 
-	timestamp = _safe_timestamp(payload.get("timestamp")) or time.time()
+	timestamp = _safe_timestamp(payload.get("timestamp")) or now
 	clamped = max(0.0, min(float(light_value), float(LIGHT_MAX)))
-	with state_lock:
-		latest_sensor["light"] = clamped
-		latest_sensor["timestamp"] = timestamp
+	global _latest_light, _latest_light_ts
+	_latest_light = clamped
+	_latest_light_ts = timestamp
+	_mark_state_dirty()
 
 
-def _handle_button_payload(payload: Dict[str, Any]) -> None:
+def _handle_button_payload(payload: Dict[str, Any], now: float) -> None:
 	event_raw = payload.get("event")
 	if not isinstance(event_raw, str):
 		logger.warning("Unexpected button payload: %s", payload)
@@ -107,39 +170,50 @@ def _handle_button_payload(payload: Dict[str, Any]) -> None:
 		logger.warning("Unknown button event '%s'", event_raw)
 		return
 
-	timestamp = _safe_timestamp(payload.get("timestamp")) or time.time()
+	timestamp = _safe_timestamp(payload.get("timestamp")) or now
 	entry = {
 		"event": event,
 		"timestamp": timestamp,
 	}
-	with state_lock:
-		button_events.appendleft(entry)
+	global _events_idx
+	_events_buf[_events_idx % MAX_EVENT_HISTORY] = entry
+	_events_idx += 1
+	_mark_state_dirty()
 
 
-def _handle_led_payload(topic: str, payload: Dict[str, Any]) -> None:
+def _handle_led_payload(color: str, payload: Dict[str, Any], _now: float) -> None:
 	state_raw = payload.get("state")
 	if not isinstance(state_raw, str):
-		logger.warning("Unexpected LED payload on %s: %s", topic, payload)
+		logger.warning("Unexpected LED payload for %s: %s", color, payload)
 		return
 	state = state_raw.strip().upper()
 	if state not in VALID_LED_STATES:
-		logger.warning("Unknown LED state '%s' on %s", state_raw, topic)
+		logger.warning("Unknown LED state '%s' for %s", state_raw, color)
 		return
-	color = next((name for name, topic_name in TOPIC_LEDS.items() if topic_name == topic), None)
-	if color is None:
-		return
-	with state_lock:
+	global _led_snapshot
+	with leds_lock:
 		led_states[color] = state
+		_led_snapshot = tuple(led_states.items())
+	_mark_state_dirty()
 
 
-def _handle_display_payload(payload: Dict[str, Any]) -> None:
+def _handle_display_payload(payload: Dict[str, Any], now: float) -> None:
 	text_raw = payload.get("text")
 	if not isinstance(text_raw, str):
 		logger.warning("Unexpected display payload: %s", payload)
 		return
 	text = text_raw[:16]
-	with state_lock:
-		last_display_message.update({"text": text, "timestamp": time.time()})
+	global _display_snapshot
+	_display_snapshot = (text, now)
+	_mark_state_dirty()
+
+
+_TOPIC_DISPATCH = {
+	TOPIC_LIGHT: _handle_light_payload,
+	TOPIC_BUTTON: _handle_button_payload,
+	TOPIC_DISPLAY: _handle_display_payload,
+	**{topic: functools.partial(_handle_led_payload, color) for topic, color in _LED_TOPIC_TO_COLOR.items()},
+}
 
 
 def _on_connect(client: mqtt.Client, _userdata: Any, _flags: Dict[str, Any], rc: int) -> None:
@@ -148,59 +222,58 @@ def _on_connect(client: mqtt.Client, _userdata: Any, _flags: Dict[str, Any], rc:
 		client.subscribe([(TOPIC_LIGHT, 0), (TOPIC_BUTTON, 0)])
 		client.subscribe([(topic, 0) for topic in TOPIC_LEDS.values()])
 		client.subscribe([(TOPIC_DISPLAY, 0)])
-		with state_lock:
+		with conn_lock:
 			connection_state.update({"connected": True, "last_error": None})
-			led_snapshot = dict(led_states)
-			display_snapshot = dict(last_display_message)
-		for color, state in led_snapshot.items():
+		_mark_state_dirty()
+		display_text, _display_ts = _display_snapshot
+		for color, state in _led_snapshot:
 			try:
-				client.publish(TOPIC_LEDS[color], json.dumps({"state": state}), qos=1, retain=True)
+				client.publish(TOPIC_LEDS[color], _json_dumps({"state": state}), qos=1, retain=True)
 			except Exception as exc:  # pylint: disable=broad-except
 				logger.debug("Failed to publish retained LED state for %s: %s", color, exc)
-		if display_snapshot.get("text"):
+		if display_text:
 			try:
-				client.publish(TOPIC_DISPLAY, json.dumps({"text": display_snapshot["text"]}), qos=1, retain=True)
+				client.publish(TOPIC_DISPLAY, _json_dumps({"text": display_text}), qos=1, retain=True)
 			except Exception as exc:  # pylint: disable=broad-except
 				logger.debug("Failed to publish retained display text: %s", exc)
 	else:
 		logger.error("MQTT connection failed with code %s", rc)
-		with state_lock:
+		with conn_lock:
 			connection_state.update({
 				"connected": False,
 				"last_error": f"Connection failed (code {rc})",
 			})
+		_mark_state_dirty()
 
 
 def _on_message(client: mqtt.Client, _userdata: Any, msg: mqtt.MQTTMessage) -> None:
 	try:
-		payload = json.loads(msg.payload.decode("utf-8"))
-	except json.JSONDecodeError:
+		payload = _json_loads(msg.payload)
+	except ValueError:
 		logger.warning("Failed to decode MQTT payload on %s", msg.topic)
 		return
 
-	if msg.topic == TOPIC_LIGHT:
-		_handle_light_payload(payload)
-	elif msg.topic == TOPIC_BUTTON:
-		_handle_button_payload(payload)
-	elif msg.topic in TOPIC_LEDS.values():
-		_handle_led_payload(msg.topic, payload)
-	elif msg.topic == TOPIC_DISPLAY:
-		_handle_display_payload(payload)
+	# One clock read per message, shared by the handler and last_message_at.
+	now = time.time()
+	handler = _TOPIC_DISPATCH.get(msg.topic)
+	if handler is not None:
+		handler(payload, now)
 	else:
 		logger.debug("Unhandled topic %s", msg.topic)
 
-	with state_lock:
-		connection_state["last_message_at"] = time.time()
+	# A plain dict store is atomic under the GIL, so no lock is needed here.
+	connection_state["last_message_at"] = now
 
 
 def _on_disconnect(client: mqtt.Client, _userdata: Any, rc: int) -> None:
 	reason = "clean" if rc == 0 else f"unexpected (code {rc})"
 	logger.warning("Disconnected from MQTT broker: %s", reason)
-	with state_lock:
+	with conn_lock:
 		connection_state.update({
 			"connected": False,
 			"last_error": None if rc == 0 else f"Disconnected (code {rc})",
 		})
+	_mark_state_dirty()
 
 
 def _build_mqtt_client() -> mqtt.Client:
@@ -228,7 +301,7 @@ def start_mqtt() -> None:
 			logger.info("Started MQTT listener thread")
 		except Exception as exc:  # pylint: disable=broad-except
 			logger.exception("Unable to start MQTT client: %s", exc)
-			with state_lock:
+			with conn_lock:
 				connection_state.update({
 					"connected": False,
 					"last_error": str(exc),
@@ -255,104 +328,144 @@ def _shutdown_mqtt() -> None:
 start_mqtt()
 
 
+_cached_index_html: Optional[str] = None
+
+
 @app.route("/")
 def index() -> str:
-	context = {
-		"mqtt_broker": MQTT_BROKER,
-		"topics": {
-			"light": TOPIC_LIGHT,
-			"button": TOPIC_BUTTON,
-			"leds": TOPIC_LEDS,
-			"display": TOPIC_DISPLAY,
-		},
-	}
-	return render_template("index.html", **context)
-
+	# The template context is entirely static, so render Jinja once and
+	# serve the cached string on every later request.
+	global _cached_index_html
+	if _cached_index_html is None:
+		context = {
+			"mqtt_broker": MQTT_BROKER,
+			"topics": {
+				"light": TOPIC_LIGHT,
+				"button": TOPIC_BUTTON,
+				"leds": TOPIC_LEDS,
+				"display": TOPIC_DISPLAY,
+			},
+		}
+		_cached_index_html = render_template("index.html", **context)
+	return _cached_index_html
+
+
+def _state_body() -> bytes:
+	global _state_dirty, _state_cache
+
+	if not _state_dirty and _state_cache:
+		return _state_cache
+
+	# Clear the flag before building so a write that lands mid-build
+	# re-marks the cache dirty and the next poll rebuilds it.
+	_state_dirty = False
+
+	light = _latest_light
+	light_ts = _latest_light_ts
+	if light is not _latest_light:  # torn pair: a write landed between reads
+		light = _latest_light
+		light_ts = _latest_light_ts
+	sensor_data = None
+	if light is not None:
+		sensor_data = {
+			"light": light,
+			"timestamp": light_ts,
+		}
 
-@app.route("/api/state")
-def get_state() -> Any:
-	with state_lock:
-		sensor_data = None
-		if latest_sensor["light"] is not None:
-			sensor_data = {
-				"light": latest_sensor["light"],
-				"timestamp": latest_sensor["timestamp"],
-				"timestamp_iso": _to_iso(latest_sensor["timestamp"]),
-			}
-
-		events = [
-			{
-				"event": entry["event"],
-				"timestamp": entry["timestamp"],
-				"timestamp_iso": _to_iso(entry["timestamp"]),
-			}
-			for entry in islice(button_events, 6)
-		]
+	idx = _events_idx
+	count = min(6, idx, MAX_EVENT_HISTORY)
+	raw_events = [_events_buf[(idx - 1 - offset) % MAX_EVENT_HISTORY] for offset in range(count)]
+	events = [
+		{
+			"event": entry["event"],
+			"timestamp": entry["timestamp"],
+		}
+		for entry in raw_events
+	]
 
+	with conn_lock:
 		connection_snapshot = {
 			"connected": connection_state["connected"],
 			"last_error": connection_state["last_error"],
 			"last_message_at": connection_state["last_message_at"],
-			"last_message_at_iso": _to_iso(connection_state["last_message_at"]),
 		}
 
-		led_snapshot = dict(led_states)
-		display_snapshot = dict(last_display_message)
+	display_text, display_ts = _display_snapshot
 
 	payload = {
 		"sensor": sensor_data,
 		"events": events,
 		"connection": connection_snapshot,
-		"leds": led_snapshot,
+		"leds": dict(_led_snapshot),
 		"display": {
-			"text": display_snapshot.get("text", ""),
-			"timestamp": display_snapshot.get("timestamp"),
-			"timestamp_iso": _to_iso(display_snapshot.get("timestamp")),
-		},
-		"meta": {
-			"topics": {
-				"light": TOPIC_LIGHT,
-				"button": TOPIC_BUTTON,
-				"leds": TOPIC_LEDS,
-				"display": TOPIC_DISPLAY,
-			},
-			"light_max": LIGHT_MAX,
+			"text": display_text,
+			"timestamp": display_ts,
 		},
 	}
-	return jsonify(payload)
+	_state_cache = _json_dumps(payload)[:-1] + b',"meta":' + _META_JSON + b"}"
+	return _state_cache
+
+
+def _event_stream():
+	last_seq = -1
+	while True:
+		with _update_cond:
+			if _update_seq == last_seq:
+				_update_cond.wait(timeout=15.0)
+			seq = _update_seq
+		if seq == last_seq:
+			# Periodic comment keeps proxies from timing out the stream and
+			# lets the server notice disconnected clients.
+			yield b": keep-alive\n\n"
+			continue
+		last_seq = seq
+		yield b"data: " + _state_body() + b"\n\n"
+
+
+@app.route("/api/state")
+def get_state() -> Any:
+	return Response(_state_body(), mimetype="application/json")
+
+
+@app.route("/api/stream")
+def stream_state() -> Any:
+	return Response(_event_stream(), mimetype="text/event-stream")
 
 
 @app.route("/api/led/<color>", methods=["POST"])
 def set_led_state(color: str) -> Any:
 	color_key = color.lower()
 	if color_key not in TOPIC_LEDS:
-		return jsonify({"error": "Unknown LED color"}), 404
+		return _json({"error": "Unknown LED color"}, 404)
 
 	data = request.get_json(silent=True) or {}
 	state_raw = data.get("state")
 	if state_raw is None:
-		return jsonify({"error": "Missing 'state' field"}), 400
+		return _json({"error": "Missing 'state' field"}, 400)
 	state = str(state_raw).strip().upper()
 	if state not in VALID_LED_STATES:
-		return jsonify({"error": "State must be 'ON' or 'OFF'"}), 400
+		return _json({"error": "State must be 'ON' or 'OFF'"}, 400)
 
 	_ensure_mqtt_running()
 
-	with state_lock:
+	global _led_snapshot
+	with leds_lock:
 		led_states[color_key] = state
-		led_snapshot = dict(led_states)
+		_led_snapshot = tuple(led_states.items())
+	led_snapshot = dict(_led_snapshot)
+	_mark_state_dirty()
 
 	topic = TOPIC_LEDS[color_key]
 	if mqtt_client is None:
 		logger.warning("LED update requested before MQTT client ready")
 	else:
-		payload = json.dumps({"state": state})
+		payload = _json_dumps({"state": state})
 		try:
 			mqtt_client.publish(topic, payload=payload, qos=1, retain=True)
 		except Exception as exc:  # pylint: disable=broad-except
 			logger.exception("Failed to publish LED state for %s: %s", color_key, exc)
 
-	return jsonify({"color": color_key, "state": state, "leds": led_snapshot})
+	return _json({"color": color_key, "state": state, "leds": led_snapshot})
 
 
 @app.route("/api/display", methods=["POST"])
@@ -360,42 +473,42 @@ def send_display_message() -> Any:
 	data = request.get_json(silent=True) or {}
 	text_raw = data.get("text", "")
 	if not isinstance(text_raw, str):
-		return jsonify({"error": "'text' must be a string"}), 400
+		return _json({"error": "'text' must be a string"}, 400)
 	text = text_raw.strip()
 	if not text:
-		return jsonify({"error": "Text must not be empty"}), 400
+		return _json({"error": "Text must not be empty"}, 400)
 	if len(text) > 16:
-		return jsonify({"error": "Text must be 16 characters or fewer"}), 400
+		return _json({"error": "Text must be 16 characters or fewer"}, 400)
 
 	_ensure_mqtt_running()
 
-	with state_lock:
-		last_display_message.update({"text": text, "timestamp": time.time()})
-		display_snapshot = dict(last_display_message)
+	global _display_snapshot
+	display_snapshot = (text, time.time())
+	_display_snapshot = display_snapshot
+	_mark_state_dirty()
 
 	if mqtt_client is None:
 		logger.warning("Display update requested before MQTT client ready")
 	else:
-		payload = json.dumps({"text": text})
+		payload = _json_dumps({"text": text})
 		try:
 			mqtt_client.publish(TOPIC_DISPLAY, payload=payload, qos=1, retain=True)
 		except Exception as exc:  # pylint: disable=broad-except
 			logger.exception("Failed to publish display text: %s", exc)
 
-	return jsonify({
+	return _json({
 		"display": {
-			"text": display_snapshot.get("text", ""),
-			"timestamp": display_snapshot.get("timestamp"),
-			"timestamp_iso": _to_iso(display_snapshot.get("timestamp")),
+			"text": display_snapshot[0],
+			"timestamp": display_snapshot[1],
 		},
 	})
 
 
 @app.route("/health")
 def health() -> Any:
-	with state_lock:
+	with conn_lock:
 		healthy = mqtt_started and (connection_state["connected"] or connection_state["last_error"] is None)
-	return jsonify({"status": "ok" if healthy else "degraded"})
+	return _json({"status": "ok" if healthy else "degraded"})
 
 
 if __name__ == "__main__":
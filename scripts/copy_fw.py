@@ -7,7 +7,15 @@ os.makedirs(OUT, exist_ok=True)
 
 def _copy_to_wokwi(target, source, env):  # callback signature: (target, source, env)
     src = str(target[0])                  # path to the built file
-    shutil.copy2(src, os.path.join(OUT, os.path.basename(src)))
+    dst = os.path.join(OUT, os.path.basename(src))
+    try:
+        os.unlink(dst)                    # hardlinking over an existing file fails
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(src, dst)                 # zero-copy on the same filesystem
+    except OSError:
+        shutil.copy2(src, dst)            # cross-filesystem fallback
     print(f"[wokwi] copied {os.path.basename(src)}")
 
 # run after build finishes producing these files